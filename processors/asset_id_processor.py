@@ -3,129 +3,174 @@ from typing import Dict, Optional, List
 import re
 import streamlit as st
 import pandas as pd
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from utils.column_mapping import validate_columns, apply_column_mapping, clean_text_for_id
-from utils.abbreviation_service import get_abbreviation
+from utils.abbreviation_service import MAX_CONCURRENT_REQUESTS, get_abbreviation, get_abbreviations_bulk
+from utils.equipment_abbreviations import fallback_abbr_series, map_known, prewarm_abbreviations
 
-def _clean_id_part(text: str) -> str:
+# Abbreviation backends for equipment codes:
+# - 'ai': utils.abbreviation_service, with OpenAI for unknown terms
+# - 'equipment_table': utils.equipment_abbreviations, matching its predefined equipment
+#   names first and using OpenAI only for the names it can't match
+ABBR_BACKENDS = ('ai', 'equipment_table')
+
+# Characters that are stripped from ID parts: anything that is not a Unicode letter or digit
+_CLEAN_RE = re.compile(r'[^\w]|_')
+
+# Maximum number of abbreviation lookups running at once, matching the HTTP connection pool
+_MAX_WORKERS = MAX_CONCURRENT_REQUESTS
+
+def _text_column(df: pd.DataFrame, column: str) -> pd.Series:
+    """Get a column as stripped strings, with missing values as empty strings"""
+    if column not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    return df[column].fillna('').astype(str).str.strip()
+
+def _map_unique(values: pd.Series, abbreviate) -> pd.Series:
+    """Abbreviate each unique value once and map the results back onto the column"""
+    abbr_map = {text: abbreviate(text) for text in values.unique() if text}
+    return values.map(abbr_map).fillna('').astype(str)
+
+def _abbreviate_column(values: pd.Series, max_len: int = 4, type_hint: str = None,
+                       abbreviations: Optional[Dict[str, str]] = None) -> pd.Series:
+    """Abbreviate a column with the abbreviation service, reusing already resolved abbreviations"""
+    abbreviations = abbreviations or {}
+    return _map_unique(values, lambda text: abbreviations.get(text) or get_abbreviation(text, max_len, type_hint))
+
+def _clean_id_part(values: pd.Series) -> pd.Series:
     """Clean and standardize ID part"""
-    if not text:
-        return ''
-    # Remove spaces and special characters, convert to uppercase
-    cleaned = ''.join(c for c in str(text).strip() if c.isalnum() or c == ' ')
-    # Replace remaining spaces with nothing
-    cleaned = cleaned.replace(' ', '')
-    return cleaned.upper()
-
-def _abbreviate_building(name: str, max_len: int = 4) -> str:
-    """Create an abbreviation for building name"""
-    if not name:
-        return ''
-    return get_abbreviation(name, max_len, 'location')
-
-def _get_equipment_code(row: pd.Series) -> str:
+    # Remove spaces and special characters, convert to uppercase; object dtype keeps this on
+    # Python's re, as pyarrow-backed strings only treat ASCII letters and digits as \w
+    return values.astype(object).str.replace(_CLEAN_RE, '', regex=True).str.upper()
+
+def _abbreviate_building(names: pd.Series, max_len: int = 4,
+                         abbreviations: Optional[Dict[str, str]] = None) -> pd.Series:
+    """Create an abbreviation for building names"""
+    return _abbreviate_column(names, max_len, 'location', abbreviations)
+
+def _equipment_source(df: pd.DataFrame) -> pd.Series:
+    """Get the name each equipment code is built from, empty where there is none"""
+    # First try Asset/Equipment, then fall back to Asset System
+    equipment = _text_column(df, 'Asset / Equipment')
+    system = _text_column(df, 'Asset System')
+    has_equipment = equipment.ne('') & equipment.str.lower().ne('none')
+    has_system = system.ne('') & system.str.lower().ne('none')
+    
+    return equipment.where(has_equipment, system.where(has_system, ''))
+
+def _get_equipment_code(df: pd.DataFrame, abbr_backend: str = 'ai',
+                        abbreviations: Optional[Dict[str, str]] = None) -> pd.Series:
     """Get equipment code based on Asset/Equipment or Asset System"""
-    # First try Asset/Equipment
-    equipment = str(row.get('Asset / Equipment', '')).strip()
-    if equipment and equipment.lower() != 'none':
-        return get_abbreviation(equipment, 4, 'equipment')
-    
-    # If no equipment, try Asset System
-    system = str(row.get('Asset System', '')).strip()
-    if system and system.lower() != 'none':
-        return get_abbreviation(system, 4, 'equipment')
-    
-    return 'EQP'  # Default if no valid value found
-
-def _get_location_code(text: str, max_len: int = 4) -> str:
-    """Get abbreviated location code"""
-    if not text:
-        return ''
-    return get_abbreviation(text, max_len, 'location')
-
-def generate_location_id(row: pd.Series, enabled: bool) -> str:
-    """Generate location ID from Building and Floor"""
-    if not enabled:
-        return ''
-        
-    building = str(row.get('Building', '')).strip()
-    floor = _clean_id_part(str(row.get('Floor', '')).strip())
-    
-    if not building or not floor:
-        return ''
-    
-    building_code = _abbreviate_building(building)
-    
-    return f"{building_code}-{floor}"
+    source = _equipment_source(df)
+    if abbr_backend == 'equipment_table':
+        # Names were prewarmed, so one vectorized lookup resolves everything known
+        # and the rest gets the offline word-initials fallback
+        codes = map_known(source).fillna(fallback_abbr_series(source, 4))
+    else:
+        codes = _abbreviate_column(source, 4, 'equipment', abbreviations)
+    
+    return codes.where(source.ne(''), 'EQP')  # Default if no valid value found
 
-def generate_space_id(row: pd.Series, enabled: bool) -> str:
-    """Generate space ID from Building, Floor, and Sublocation"""
-    if not enabled:
-        return ''
-        
-    location_id = generate_location_id(row, True)
-    sublocation = str(row.get('Sublocation', '')).strip()
-    
-    if not location_id or not sublocation:
-        return ''
-    
-    # Get abbreviated sublocation code
-    subloc_code = _get_location_code(sublocation)
-    
-    return f"{location_id}-{subloc_code}"
+def _get_location_code(texts: pd.Series, max_len: int = 4,
+                       abbreviations: Optional[Dict[str, str]] = None) -> pd.Series:
+    """Get abbreviated location codes"""
+    return _abbreviate_column(texts, max_len, 'location', abbreviations)
 
-def generate_subspace_id(row: pd.Series, enabled: bool) -> str:
-    """Generate subspace ID from Building, Floor, Sublocation, and Subspace"""
-    if not enabled:
-        return ''
-        
-    space_id = generate_space_id(row, True)
-    subspace = str(row.get('Subspace', '')).strip()
-    
-    if not space_id or not subspace:
-        return ''
-    
-    # Get abbreviated subspace code
-    subspace_code = _get_location_code(subspace)
-    
-    return f"{space_id}-{subspace_code}"
+def _location_columns(settings: Dict[str, bool]) -> List[str]:
+    """Get the location columns whose codes the enabled ID levels need"""
+    columns = []
+    if any(settings.values()):
+        columns.append('Building')
+    if settings['create_space_id'] or settings['create_subspace_id'] or settings['create_equipment_id']:
+        columns.append('Sublocation')
+    if settings['create_subspace_id'] or settings['create_equipment_id']:
+        columns.append('Subspace')
+    return columns
 
-def generate_equipment_id(row: pd.Series, counters: defaultdict, enabled: bool) -> str:
-    """Generate equipment ID with full hierarchy and smart numbering"""
-    if not enabled:
-        return ''
-    
-    # Get all components with abbreviated codes
-    location_id = generate_location_id(row, True)
-    if not location_id:
-        return ''
-    
-    sublocation = str(row.get('Sublocation', '')).strip()
-    subloc_code = _get_location_code(sublocation) if sublocation else ''
-    
-    subspace = str(row.get('Subspace', '')).strip()
-    subspace_code = _get_location_code(subspace) if subspace else ''
-    
-    # Get equipment code
-    equipment_code = _get_equipment_code(row)
-    
-    # Create base ID without number
-    base_id = f"{location_id}"
-    if subloc_code:
-        base_id += f"-{subloc_code}"
-    if subspace_code:
-        base_id += f"-{subspace_code}"
-    base_id += f"-{equipment_code}"
-    
-    # Get counter for this combination
-    counter = counters[base_id]
-    counters[base_id] += 1
-    
-    return f"{base_id}-{counter}"
+def _prefetch_terms(terms: List[str], type_hint: str) -> Dict[str, str]:
+    """
+    Abbreviate terms up front, in bulk first and then any leftovers concurrently
+    Returns:
+    - dict of {term: abbreviation}, including the fallback for terms OpenAI couldn't abbreviate,
+      so those terms are not requested again while building the IDs
+    """
+    terms = [term for term in terms if term]
+    known = get_abbreviations_bulk(terms, 4, type_hint)
+    abbreviations = {term: known[term.lower()] for term in terms if term.lower() in known}
+    
+    # Terms the bulk request couldn't resolve are looked up one by one, overlapping the requests
+    missing = [term for term in terms if term not in abbreviations]
+    if missing:
+        with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+            abbreviations.update(zip(missing, executor.map(
+                lambda term: get_abbreviation(term, 4, type_hint), missing)))
+    return abbreviations
+
+def _prefetch_abbreviations(df: pd.DataFrame, settings: Dict[str, bool],
+                            abbr_backend: str = 'ai') -> Dict[str, Dict[str, str]]:
+    """
+    Request abbreviations for all unique terms up front, per type
+    Returns:
+    - dict of {type_hint: {term: abbreviation}} for the 'location' and 'equipment' terms
+    """
+    abbreviations = {'location': {}, 'equipment': {}}
+    if not any(settings.values()):
+        return abbreviations
+    
+    location_terms = set()
+    for column in _location_columns(settings):
+        location_terms.update(_text_column(df, column).unique())
+    abbreviations['location'] = _prefetch_terms(list(location_terms), 'location')
+    
+    if settings['create_equipment_id']:
+        # Only the names equipment codes are actually built from
+        equipment_terms = set(_equipment_source(df).unique())
+        if abbr_backend == 'equipment_table':
+            prewarm_abbreviations(pd.Series(sorted(equipment_terms), dtype=object))
+        else:
+            abbreviations['equipment'] = _prefetch_terms(list(equipment_terms), 'equipment')
+    return abbreviations
+
+def generate_location_id(building_code: pd.Series, floor: pd.Series) -> pd.Series:
+    """Generate location IDs from building codes and cleaned floors"""
+    valid = building_code.ne('') & floor.ne('')
+    return (building_code + '-' + floor).where(valid, '')
+
+def generate_space_id(location_id: pd.Series, subloc_code: pd.Series) -> pd.Series:
+    """Generate space IDs from location IDs and sublocation codes"""
+    valid = location_id.ne('') & subloc_code.ne('')
+    return (location_id + '-' + subloc_code).where(valid, '')
 
-def generate_asset_ids(df: pd.DataFrame, settings: Dict[str, bool]) -> pd.DataFrame:
+def generate_subspace_id(space_id: pd.Series, subspace_code: pd.Series) -> pd.Series:
+    """Generate subspace IDs from space IDs and subspace codes"""
+    valid = space_id.ne('') & subspace_code.ne('')
+    return (space_id + '-' + subspace_code).where(valid, '')
+
+def generate_equipment_id(location_id: pd.Series, subloc_code: pd.Series, subspace_code: pd.Series,
+                          equipment_code: pd.Series) -> pd.Series:
+    """Generate equipment IDs with full hierarchy and smart numbering"""
+    # Create base IDs without number, skipping empty levels
+    base_id = location_id
+    base_id = base_id.where(subloc_code.eq(''), base_id + '-' + subloc_code)
+    base_id = base_id.where(subspace_code.eq(''), base_id + '-' + subspace_code)
+    base_id = base_id + '-' + equipment_code
+    
+    # Number each combination from 1, in row order
+    valid = location_id.ne('')
+    base_id = base_id[valid]
+    counter = base_id.groupby(base_id, sort=False).cumcount() + 1
+    
+    equipment_ids = pd.Series('', index=location_id.index, dtype=object)
+    equipment_ids[valid] = base_id + '-' + counter.astype(str)
+    
+    return equipment_ids
+
+def generate_asset_ids(df: pd.DataFrame, settings: Dict[str, bool], abbr_backend: str = 'ai') -> pd.DataFrame:
     """Main function to generate asset IDs for the dataframe."""
     try:
+        if abbr_backend not in ABBR_BACKENDS:
+            raise ValueError(f"Unknown abbreviation backend '{abbr_backend}', expected one of: {', '.join(ABBR_BACKENDS)}")
+        
         # Convert all column names to strings
         df.columns = df.columns.astype(str)
         
@@ -140,28 +185,44 @@ def generate_asset_ids(df: pd.DataFrame, settings: Dict[str, bool]) -> pd.DataFr
         if column_mapping:
             df = apply_column_mapping(df, column_mapping)
         
-        # Initialize counter dictionary for equipment IDs
-        equipment_counters = defaultdict(lambda: 1)
+        # Resolve abbreviations for every unique term before building IDs
+        abbreviations = _prefetch_abbreviations(df, settings, abbr_backend)
+        location_abbr = abbreviations['location']
+        
+        # Compute each ID component the enabled ID levels need once and share it between them
+        location_columns = _location_columns(settings)
+        no_code = pd.Series('', index=df.index, dtype=object)
+        building_code = (_abbreviate_building(_text_column(df, 'Building'), abbreviations=location_abbr)
+                         if 'Building' in location_columns else no_code)
+        floor = _clean_id_part(_text_column(df, 'Floor'))
+        subloc_code = (_get_location_code(_text_column(df, 'Sublocation'), abbreviations=location_abbr)
+                       if 'Sublocation' in location_columns else no_code)
+        subspace_code = (_get_location_code(_text_column(df, 'Subspace'), abbreviations=location_abbr)
+                         if 'Subspace' in location_columns else no_code)
         
-        # Create a copy to avoid modifying the original
-        result_df = df.copy()
+        location_id = generate_location_id(building_code, floor)
+        space_id = generate_space_id(location_id, subloc_code)
+        subspace_id = generate_subspace_id(space_id, subspace_code)
         
-        # Process each row
-        for index, row in df.iterrows():
-            # Generate IDs based on settings
-            if settings['create_location_id']:
-                result_df.at[index, 'location_id'] = generate_location_id(row, True)
-                
-            if settings['create_space_id']:
-                result_df.at[index, 'space_id'] = generate_space_id(row, True)
-                
-            if settings['create_subspace_id']:
-                result_df.at[index, 'subspace_id'] = generate_subspace_id(row, True)
-                
-            if settings['create_equipment_id']:
-                result_df.at[index, 'equipment_id'] = generate_equipment_id(row, equipment_counters, True)
+        # Collect only the new ID columns based on settings
+        new_cols = {}
+        if settings['create_location_id']:
+            new_cols['location_id'] = location_id
+            
+        if settings['create_space_id']:
+            new_cols['space_id'] = space_id
+            
+        if settings['create_subspace_id']:
+            new_cols['subspace_id'] = subspace_id
+            
+        if settings['create_equipment_id']:
+            equipment_code = _get_equipment_code(df, abbr_backend, abbreviations['equipment'])
+            new_cols['equipment_id'] = generate_equipment_id(
+                location_id, subloc_code, subspace_code, equipment_code
+            )
         
-        return result_df
+        # Add them without copying or modifying the original data
+        return df.assign(**new_cols)
         
     except Exception as e:
         st.error(f"Error processing asset IDs: {str(e)}")
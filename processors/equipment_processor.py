@@ -1,5 +1,6 @@
 import os
 import sys
+import importlib.util
 import pandas as pd
 from io import StringIO
 
@@ -12,6 +13,17 @@ from utils.error_handler import handle_error, logger
 from utils.validation_constants import EQUIPMENT_TYPES, EQUIPMENT_CLASSES
 from utils.column_mapping import validate_columns, apply_column_mapping
 
+# Read Excel files with the Rust-based calamine engine when python-calamine is installed
+# and pandas is new enough to support it (2.2+)
+_PANDAS_VERSION = tuple(int(part) for part in pd.__version__.split('.')[:2])
+EXCEL_ENGINE = ('calamine' if _PANDAS_VERSION >= (2, 2) and importlib.util.find_spec('python_calamine')
+                else None)
+
+def _non_standard_mask(values, valid_values):
+    """Flag filled-in values that are not in the case-insensitive set of valid values"""
+    normalized = values.astype(str).str.strip()
+    return values.notna() & normalized.ne('Mandatory') & ~normalized.str.lower().isin(valid_values)
+
 def validate_equipment_data(df, source_data):
     """Validate equipment types and classes in the dataframe"""
     warnings = []
@@ -20,25 +32,25 @@ def validate_equipment_data(df, source_data):
     valid_types = {str(t).lower().strip() for t in EQUIPMENT_TYPES}
     valid_classes = {str(c).lower().strip() for c in EQUIPMENT_CLASSES}
     
-    # Track unique non-standard values for summary
-    non_standard_classes = set()
-    non_standard_types = set()
-    
     # Check equipment class (Asset System)
-    for idx, row in source_data.iterrows():
-        asset_system = row['Asset System']
-        if pd.notna(asset_system) and str(asset_system).strip() != 'Mandatory':
-            if str(asset_system).lower().strip() not in valid_classes:
-                warnings.append(f"Row {idx + 2}: Non-standard equipment class '{asset_system}' in Asset System column")
-                non_standard_classes.add(str(asset_system))
+    asset_systems = source_data['Asset System']
+    asset_systems = asset_systems[_non_standard_mask(asset_systems, valid_classes)]
+    warnings.extend(
+        f"Row {idx + 2}: Non-standard equipment class '{asset_system}' in Asset System column"
+        for idx, asset_system in asset_systems.items()
+    )
     
     # Check equipment type (Asset / Equipment)
-    for idx, row in source_data.iterrows():
-        asset_equipment = row['Asset / Equipment']
-        if pd.notna(asset_equipment) and str(asset_equipment).strip() != 'Mandatory':
-            if str(asset_equipment).lower().strip() not in valid_types:
-                warnings.append(f"Row {idx + 2}: Non-standard equipment type '{asset_equipment}' in Asset/Equipment column")
-                non_standard_types.add(str(asset_equipment))
+    asset_equipment = source_data['Asset / Equipment']
+    asset_equipment = asset_equipment[_non_standard_mask(asset_equipment, valid_types)]
+    warnings.extend(
+        f"Row {idx + 2}: Non-standard equipment type '{equipment}' in Asset/Equipment column"
+        for idx, equipment in asset_equipment.items()
+    )
+    
+    # Track unique non-standard values for summary
+    non_standard_classes = set(asset_systems.astype(str))
+    non_standard_types = set(asset_equipment.astype(str))
     
     if warnings:
         # Add summary of unique non-standard values
@@ -67,7 +79,7 @@ def process_equipment_data(asset_location_file, equipment_template, namespace, c
     logger.info("Starting equipment data processing")
     
     # Load data
-    asset_location_data = pd.read_excel(asset_location_file, sheet_name='Asset,location')
+    asset_location_data = pd.read_excel(asset_location_file, sheet_name='Asset,location', engine=EXCEL_ENGINE)
     template_data = pd.read_csv(equipment_template)
     
     # Validate columns and get missing/available columns
@@ -80,32 +92,31 @@ def process_equipment_data(asset_location_file, equipment_template, namespace, c
     if column_mapping:
         asset_location_data = apply_column_mapping(asset_location_data, column_mapping)
     
+    # Filter valid rows first so fewer rows go through de-duplication
+    asset_system = asset_location_data['Asset System']
+    asset_equipment = asset_location_data['Asset / Equipment']
+    filtered_data = asset_location_data[
+        (asset_system.notna() | asset_equipment.notna()) &
+        (asset_system != 'Mandatory') &
+        (asset_equipment != 'Mandatory')
+    ]
+    
     # Extract unique equipment data
-    unique_data = asset_location_data[
+    valid_data = filtered_data[
         ['Barcode', 'Asset System', 'Asset / Equipment', 'Asset Criticality', 'Sublocation']
     ].drop_duplicates()
     
-    # Filter valid data
-    valid_data = unique_data[
-        (unique_data['Asset System'].notna() | unique_data['Asset / Equipment'].notna()) &
-        (unique_data['Asset System'] != 'Mandatory') &
-        (unique_data['Asset / Equipment'] != 'Mandatory')
-    ]
-    
     # Check for non-standard equipment data
     validation_warnings = validate_equipment_data(template_data, valid_data)
     
     # Create new equipment data
     new_equipment_data = pd.DataFrame({
-        'barcode': valid_data['Barcode'].reset_index(drop=True),
-        'name*': valid_data.apply(
-            lambda x: x['Asset / Equipment'] if pd.notna(x['Asset / Equipment']) else x['Asset System'],
-            axis=1
-        ).reset_index(drop=True),
-        'type': valid_data['Asset / Equipment'].reset_index(drop=True),  # Equipment Type
-        'class': valid_data['Asset System'].reset_index(drop=True),      # Equipment Class
-        'criticality': valid_data['Asset Criticality'].reset_index(drop=True),
-        'space name': valid_data['Sublocation'].reset_index(drop=True),
+        'barcode': valid_data['Barcode'].to_numpy(),
+        'name*': valid_data['Asset / Equipment'].combine_first(valid_data['Asset System']).to_numpy(),
+        'type': valid_data['Asset / Equipment'].to_numpy(),  # Equipment Type
+        'class': valid_data['Asset System'].to_numpy(),      # Equipment Class
+        'criticality': valid_data['Asset Criticality'].to_numpy(),
+        'space name': valid_data['Sublocation'].to_numpy(),
         'namespace*': namespace,
         'isActive*': True
     })
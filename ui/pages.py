@@ -3,19 +3,21 @@ import sys
 import streamlit as st
 import pandas as pd
 import io
+from openpyxl import Workbook
 
 # Add the parent directory to Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 
-from processors.asset_id_processor import generate_asset_ids
+from processors.asset_id_processor import ABBR_BACKENDS, generate_asset_ids
 from processors.facility_processor import process_facility_data
 from processors.location_processor import process_location_data
 from processors.space_processor import process_space_data
 from processors.equipment_processor import process_equipment_data
 from processors.system_asset_processor import process_system_asset_mapping
 from utils.error_handler import logger
+from utils.column_mapping import validate_columns, apply_column_mapping
 
 def get_template_path(template_name):
     """Get the absolute path to a template file"""
@@ -33,6 +35,29 @@ def show_preview_table(df, title="Preview"):
         ) for col in df.columns}
     )
 
+def to_excel_bytes(df, sheet_name):
+    """Write a DataFrame to an in-memory Excel file, streaming rows through a write-only workbook"""
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=sheet_name)
+    worksheet.append([str(col) for col in df.columns])
+    for row in df.itertuples(index=False, name=None):
+        worksheet.append([None if pd.isna(value) else value for value in row])
+    
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=4, ttl=3600)
+def _load_and_map(file_bytes, sheet_name):
+    """Load a sheet and apply the asset ID column mapping, cached on file contents and sheet name"""
+    df = pd.read_excel(io.BytesIO(file_bytes), sheet_name=sheet_name)
+    df.columns = df.columns.astype(str)
+    
+    _, column_mapping = validate_columns(df, 'asset_id')
+    if column_mapping:
+        df = apply_column_mapping(df, column_mapping)
+    return df
+
 def render_asset_id_page():
     st.header("Asset ID Generator")
     
@@ -52,6 +77,18 @@ def render_asset_id_page():
             create_subspace_id = st.checkbox("Generate Subspace IDs (FAC-LOC-SPC-SSP-XXX)", value=False)
             create_equipment_id = st.checkbox("Generate Equipment IDs (EQP-XXX)", value=True)
         
+        # Source of the equipment codes used in equipment IDs
+        abbr_backend = st.radio(
+            "Equipment abbreviations",
+            options=ABBR_BACKENDS,
+            format_func=lambda backend: {
+                'ai': "General abbreviations (OpenAI)",
+                'equipment_table': "Predefined equipment names first, then OpenAI"
+            }[backend],
+            horizontal=True,
+            disabled=not create_equipment_id
+        )
+        
         # Settings dictionary
         settings = {
             'create_location_id': create_location_id,
@@ -66,26 +103,23 @@ def render_asset_id_page():
         # Process button
         if st.button("Process File"):
             try:
-                df = pd.read_excel(uploaded_file, sheet_name=sheet_name)
+                # Reuse the parsed sheet when the same file is processed again
+                df = _load_and_map(uploaded_file.getvalue(), sheet_name)
                 
-                # Show preview of original data
-                show_preview_table(df, "Original Data Preview")
+                # Show preview of the data with standard column names
+                show_preview_table(df, "Mapped Data Preview")
                 
                 # Process the data with selected settings
-                result = generate_asset_ids(df, settings)
+                result = generate_asset_ids(df, settings, abbr_backend)
                 
                 if result is not None:
                     show_preview_table(result, "Generated Asset IDs")
                     st.success("File processed successfully!")
                     
                     # Prepare download button
-                    output = io.BytesIO()
-                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                        result.to_excel(writer, index=False, sheet_name=sheet_name)
-                    
                     st.download_button(
                         label="Download Processed Excel",
-                        data=output.getvalue(),
+                        data=to_excel_bytes(result, sheet_name),
                         file_name="processed_assets.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
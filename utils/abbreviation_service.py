@@ -1,11 +1,17 @@
 """Service for generating abbreviations using AI"""
 import re
-import os
+import json
+import threading
 import requests
-from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from types import MappingProxyType
+from typing import Dict, List, Optional
 
-# Common abbreviation mappings
-COMMON_ABBR = {
+from utils.helpers import get_openai_api_key
+
+# Common abbreviation mappings (read-only)
+COMMON_ABBR = MappingProxyType({
     # Locations
     'compound management office': 'CMO',
     'management office': 'MGO',
@@ -34,23 +40,41 @@ COMMON_ABBR = {
     'plumbing': 'PLB',
     'fire protection': 'FPS',
     'security': 'SEC',
-}
+})
+
+# Abbreviations learned from OpenAI at runtime, shared between sessions
+_learned_abbr: Dict[str, str] = {}
+_learned_lock = threading.Lock()
+
+# Maximum number of abbreviation requests sent to OpenAI at once
+MAX_CONCURRENT_REQUESTS = 16
+
+# Shared HTTP session that keeps connections to OpenAI alive and retries transient failures,
+# with a connection pool large enough for every concurrent lookup
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=frozenset({"POST"})),
+    pool_maxsize=MAX_CONCURRENT_REQUESTS
+))
+_SESSION.headers.update({"Content-Type": "application/json"})
+
+# (connect, read) timeouts in seconds for OpenAI requests
+REQUEST_TIMEOUT = (3, 30)
+
+# Characters that are not allowed in an abbreviation
+_ABBR_STRIP = re.compile(r'[^A-Z]')
+
+# Maximum number of terms sent to OpenAI in a single bulk request
+BULK_BATCH_SIZE = 100
+
+# OpenAI API key from environment or secrets file, resolved once at import
+_API_KEY = get_openai_api_key()
 
 def get_ai_abbreviation(text: str, max_length: int = 4, system_prompt: str = None) -> Optional[str]:
     """Get an abbreviation suggestion from OpenAI"""
     try:
-        # Get API key from environment or secrets file
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            secrets_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.streamlit', 'secrets.toml')
-            if os.path.exists(secrets_path):
-                with open(secrets_path, 'r') as f:
-                    for line in f:
-                        if line.startswith('openai_api_key'):
-                            api_key = line.split('=')[1].strip().strip('"\'')
-                            break
-        
-        if not api_key:
+        if not _API_KEY:
             return None
             
         if not system_prompt:
@@ -59,12 +83,12 @@ def get_ai_abbreviation(text: str, max_length: int = 4, system_prompt: str = Non
                            "Respond with ONLY the abbreviation in uppercase, nothing else.")
             
         # Call OpenAI API
-        response = requests.post(
+        response = _SESSION.post(
             "https://api.openai.com/v1/chat/completions",
             headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
+                "Authorization": f"Bearer {_API_KEY}"
             },
+            timeout=REQUEST_TIMEOUT,
             json={
                 "model": "gpt-3.5-turbo",
                 "messages": [{
@@ -82,13 +106,92 @@ def get_ai_abbreviation(text: str, max_length: int = 4, system_prompt: str = Non
         if response.status_code == 200:
             abbr = response.json()["choices"][0]["message"]["content"].strip()
             # Ensure it meets our requirements
-            abbr = re.sub(r'[^A-Z]', '', abbr.upper())
+            abbr = _ABBR_STRIP.sub('', abbr.upper())
             return abbr[:max_length] if abbr else None
             
     except Exception as e:
         print(f"Error getting AI abbreviation: {str(e)}")
     return None
 
+def get_ai_abbreviations_batch(texts: List[str], max_length: int = 4, type_hint: str = None) -> Dict[str, str]:
+    """Get abbreviation suggestions for several texts from a single OpenAI request"""
+    try:
+        if not _API_KEY or not texts:
+            return {}
+            
+        if type_hint == 'location':
+            subject = "building location or area name"
+        elif type_hint == 'equipment':
+            subject = "facility equipment or system"
+        else:
+            subject = "term"
+        system_prompt = (f"Create a meaningful {max_length}-letter abbreviation for each {subject} in the given JSON list. "
+                        "Make them intuitive and follow industry standards when possible. "
+                        "Respond with ONLY a JSON object mapping each input exactly as given to its abbreviation in uppercase.")
+            
+        # Call OpenAI API
+        response = _SESSION.post(
+            "https://api.openai.com/v1/chat/completions",
+            headers={
+                "Authorization": f"Bearer {_API_KEY}"
+            },
+            timeout=REQUEST_TIMEOUT,
+            json={
+                "model": "gpt-3.5-turbo",
+                "messages": [{
+                    "role": "system",
+                    "content": system_prompt
+                }, {
+                    "role": "user",
+                    "content": json.dumps(texts)
+                }],
+                "max_tokens": 25 * len(texts) + 20,
+                "temperature": 0.3
+            }
+        )
+        
+        if response.status_code == 200:
+            content = response.json()["choices"][0]["message"]["content"]
+            # Ignore anything the model wrapped around the JSON object
+            mapping = json.loads(content[content.index('{'):content.rindex('}') + 1])
+            
+            abbreviations = {}
+            for text, abbr in mapping.items():
+                text = str(text).lower().strip()
+                # Ensure it meets our requirements
+                abbr = _ABBR_STRIP.sub('', str(abbr).upper())
+                if text in texts and abbr:
+                    abbreviations[text] = abbr[:max_length]
+            return abbreviations
+            
+    except Exception as e:
+        print(f"Error getting AI abbreviations: {str(e)}")
+    return {}
+
+def get_abbreviations_bulk(texts: List[str], max_length: int = 4, type_hint: str = None) -> Dict[str, str]:
+    """
+    Fetch abbreviations for all unknown texts up front, batching the OpenAI requests
+    Returns:
+    - dict of {clean_text: abbreviation} for every text with a known abbreviation
+    """
+    clean_texts = {text.lower().strip() for text in texts if text and text.lower() != 'none'}
+    pending = sorted(text for text in clean_texts
+                     if text and text not in COMMON_ABBR and text not in _learned_abbr)
+    
+    for start in range(0, len(pending), BULK_BATCH_SIZE):
+        batch = pending[start:start + BULK_BATCH_SIZE]
+        abbreviations = get_ai_abbreviations_batch(batch, max_length, type_hint)
+        # Cache the results for future use
+        with _learned_lock:
+            _learned_abbr.update(abbreviations)
+    
+    known = {}
+    for text in clean_texts:
+        abbr = COMMON_ABBR.get(text) or _learned_abbr.get(text)
+        if abbr:
+            known[text] = abbr
+    return known
+
 def get_abbreviation(text: str, max_length: int = 4, type_hint: str = None) -> str:
     """Get or generate an abbreviation for any text"""
     if not text or text.lower() == 'none':
@@ -97,9 +200,11 @@ def get_abbreviation(text: str, max_length: int = 4, type_hint: str = None) -> s
     # Clean and standardize the text
     clean_text = text.lower().strip()
     
-    # Check predefined mappings
+    # Check predefined mappings, then previously learned ones
     if clean_text in COMMON_ABBR:
         return COMMON_ABBR[clean_text]
+    if clean_text in _learned_abbr:
+        return _learned_abbr[clean_text]
     
     # Prepare system prompt based on type
     system_prompt = None
@@ -114,7 +219,8 @@ def get_abbreviation(text: str, max_length: int = 4, type_hint: str = None) -> s
     ai_abbr = get_ai_abbreviation(clean_text, max_length, system_prompt)
     if ai_abbr:
         # Cache the result for future use
-        COMMON_ABBR[clean_text] = ai_abbr
+        with _learned_lock:
+            _learned_abbr[clean_text] = ai_abbr
         return ai_abbr
         
     # Fallback: take first letter of each word
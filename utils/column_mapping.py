@@ -1,40 +1,37 @@
 """Column mapping utilities"""
+import re
 import pandas as pd
 
-# Required columns for asset ID generation
+# Required columns for asset ID generation, with lowercase alternative names
 REQUIRED_COLUMNS = {
     'asset_id': {
-        'Building': ['building', 'facility', 'site', 'property'],
-        'Floor': ['floor', 'level', 'storey'],
-        'Sublocation': ['sublocation', 'sub location', 'location', 'area', 'zone'],
-        'Subspace': ['subspace', 'sub space', 'room', 'space'],
-        'Location Criticality': ['location criticality', 'criticality', 'priority'],
-        'Sublocation Criticality': ['sublocation criticality', 'space criticality'],
-        'Subspace Criticality': ['subspace criticality', 'room criticality']
+        'Building': frozenset({'building', 'facility', 'site', 'property'}),
+        'Floor': frozenset({'floor', 'level', 'storey'}),
+        'Sublocation': frozenset({'sublocation', 'sub location', 'location', 'area', 'zone'}),
+        'Subspace': frozenset({'subspace', 'sub space', 'room', 'space'}),
+        'Location Criticality': frozenset({'location criticality', 'criticality', 'priority'}),
+        'Sublocation Criticality': frozenset({'sublocation criticality', 'space criticality'}),
+        'Subspace Criticality': frozenset({'subspace criticality', 'room criticality'})
     }
 }
 
+# Characters that are removed when cleaning text for IDs: anything that is not a
+# Unicode letter, digit or whitespace (the same set as str.isalnum/str.isspace)
+_CLEAN_RE = re.compile(r'[^\w\s]|_')
+
+def clean_series_for_id(series):
+    """Clean and format a whole column of text for ID generation"""
+    # Object dtype keeps the string steps on Python's re and str methods, matching clean_text_for_id
+    cleaned = series.where(series.notna(), '').astype(str).astype(object).str.strip()
+    # Remove special characters, convert spaces to underscores and uppercase
+    return cleaned.str.replace(_CLEAN_RE, '', regex=True).str.replace(' ', '_', regex=False).str.upper()
+
 def clean_text_for_id(text):
     """Clean and format text for ID generation"""
     if pd.isna(text) or text == '':
         return ''
-    # Convert to string first
-    text_str = str(text).strip()
-    # Remove special characters and spaces, convert to uppercase
-    cleaned = ''.join(c for c in text_str if c.isalnum() or c.isspace())
-    # Convert spaces to underscores for subspace
-    cleaned = cleaned.replace(' ', '_')
-    return cleaned.upper()
-
-def get_closest_match(column, possible_matches):
-    """Find the closest matching standard column name"""
-    try:
-        # Convert column to string and handle numeric values
-        column_str = str(column)
-        column_lower = column_str.lower().strip()
-        return column_lower in possible_matches
-    except (AttributeError, TypeError):
-        return False
+    # Remove special characters, convert spaces to underscores and uppercase
+    return _CLEAN_RE.sub('', str(text).strip()).replace(' ', '_').upper()
 
 def validate_columns(df, processor_type='asset_id'):
     """
@@ -46,26 +43,34 @@ def validate_columns(df, processor_type='asset_id'):
     missing_columns = []
     column_mapping = {}
     
-    # Convert all column names to strings and handle numeric columns
-    df_columns = df.columns.astype(str)
-    df_columns_lower = [col.lower().strip() for col in df_columns]
+    # Map each normalized column name to its position and actual name, keeping the first occurrence
+    lower_to_orig = {}
+    for position, col in enumerate(df.columns.astype(str)):
+        lower_to_orig.setdefault(col.lower().strip(), (position, col))
 
     for required_col, alternatives in REQUIRED_COLUMNS[processor_type].items():
-        found = False
-        for col in df_columns_lower:
-            if col in alternatives:
-                column_mapping[required_col] = df_columns[df_columns_lower.index(col)]
-                found = True
-                break
-        if not found:
+        # Prefer the matching column that comes first in the dataframe
+        match = min((lower_to_orig[col] for col in alternatives & lower_to_orig.keys()), default=None)
+        if match:
+            column_mapping[required_col] = match[1]
+        else:
             missing_columns.append(required_col)
 
     return missing_columns, column_mapping
 
 def apply_column_mapping(df, mapping):
-    """Apply the column mapping to the dataframe"""
-    df_copy = df.copy()
-    for standard_name, actual_name in mapping.items():
-        if actual_name in df.columns and actual_name != standard_name:
-            df_copy[standard_name] = df[actual_name]
-    return df_copy
+    """
+    Apply the column mapping to the dataframe, adding each mapped column under its standard name.
+    The original columns are kept so the output keeps the user's headers; only a shallow copy is made.
+    """
+    standard_columns = {standard_name: actual_name for standard_name, actual_name in mapping.items()
+                        if actual_name in df.columns and actual_name != standard_name}
+    
+    # Nothing to add when the columns already use the standard names
+    if not standard_columns:
+        return df
+    
+    mapped = df.copy(deep=False)
+    for standard_name, actual_name in standard_columns.items():
+        mapped[standard_name] = df[actual_name]
+    return mapped
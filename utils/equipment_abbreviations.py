@@ -1,8 +1,17 @@
 """Equipment abbreviation mappings and generator"""
 import re
 import os
+import json
+import time
+import difflib
+import threading
 import requests
-from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from utils.helpers import get_openai_api_key
 
 # Common equipment abbreviations
 EQUIPMENT_ABBR = {
@@ -56,30 +65,116 @@ EQUIPMENT_ABBR = {
     'none': 'EQP',  # Default for empty/none values
 }
 
+# Normalize keys once so lookups only need the cleaned name
+EQUIPMENT_ABBR = {name.lower().strip(): abbr for name, abbr in EQUIPMENT_ABBR.items()}
+
+# Matches any predefined equipment phrase as whole words inside a longer name, longest phrases first
+_KNOWN_PHRASE_RE = re.compile(r'\b(?:' + '|'.join(
+    re.escape(name) for name in sorted(EQUIPMENT_ABBR, key=len, reverse=True) if name != 'none'
+) + r')\b')
+
+# Predefined names considered for near-miss matching, and the similarity ratio they need
+_ABBR_KEYS = [name for name in EQUIPMENT_ABBR if name != 'none']
+FUZZY_MATCH_CUTOFF = 0.88
+
+# Abbreviations learned from OpenAI are persisted here so new sessions don't request them again
+CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.streamlit', 'equipment_abbr_cache.json')
+_cache_lock = threading.Lock()
+
+def _load_cache() -> Dict[str, str]:
+    """Load previously learned abbreviations from the cache file"""
+    try:
+        with open(CACHE_PATH, 'r') as f:
+            cached = json.load(f)
+        return {str(k): str(v) for k, v in cached.items()} if isinstance(cached, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def _save_to_cache(abbreviations: Dict[str, str]) -> None:
+    """Add learned abbreviations to the mapping and persist them to the cache file"""
+    with _cache_lock:
+        EQUIPMENT_ABBR.update(abbreviations)
+        try:
+            # Merge with the file so entries written by other processes are kept
+            cached = _load_cache()
+            cached.update(abbreviations)
+            os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+            tmp_path = f"{CACHE_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(cached, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, CACHE_PATH)
+        except OSError as e:
+            print(f"Error saving abbreviation cache: {str(e)}")
+
+# Predefined mappings take precedence over cached ones
+for _name, _abbr in _load_cache().items():
+    EQUIPMENT_ABBR.setdefault(_name, _abbr)
+
+# Maximum number of equipment names sent to OpenAI in a single request
+BATCH_SIZE = 50
+
+# Concurrency and rate limit for per-name OpenAI requests
+MAX_CONCURRENT_REQUESTS = 8
+REQUESTS_PER_MINUTE = 500
+
+# Shared HTTP session that keeps connections to OpenAI alive and retries transient failures
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=frozenset({"POST"})),
+    pool_maxsize=MAX_CONCURRENT_REQUESTS
+))
+_SESSION.headers.update({"Content-Type": "application/json"})
+
+# (connect, read) timeouts in seconds for OpenAI requests
+REQUEST_TIMEOUT = (3, 30)
+
+# Characters that are not allowed in an abbreviation
+_ABBR_STRIP = re.compile(r'[^A-Z]')
+
+# Keeps the first character of each word and drops the rest, giving the word initials
+_WORD_INITIAL_RE = re.compile(r'(\S)\S*\s*')
+
+# Matches one "1. ABBR" line of a numbered list response
+_NUMBERED_LINE_RE = re.compile(r'^[ \t]*(\d+)[.)][ \t]*(.*)$', re.MULTILINE)
+
+class _RateLimiter:
+    """Token bucket that keeps requests under a requests-per-minute limit"""
+    
+    def __init__(self, requests_per_minute: int, burst: int):
+        self._rate = requests_per_minute / 60.0
+        self._capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
 def get_openai_abbreviation(equipment_name: str, max_length: int = 4) -> Optional[str]:
     """Get an abbreviation suggestion from OpenAI"""
     try:
-        # Get API key from environment or secrets file
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            secrets_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.streamlit', 'secrets.toml')
-            if os.path.exists(secrets_path):
-                with open(secrets_path, 'r') as f:
-                    for line in f:
-                        if line.startswith('openai_api_key'):
-                            api_key = line.split('=')[1].strip().strip('"\'')
-                            break
-        
+        api_key = get_openai_api_key()
         if not api_key:
             return None
             
         # Call OpenAI API
-        response = requests.post(
+        response = _SESSION.post(
             "https://api.openai.com/v1/chat/completions",
             headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
+                "Authorization": f"Bearer {api_key}"
             },
+            timeout=REQUEST_TIMEOUT,
             json={
                 "model": "gpt-3.5-turbo",
                 "messages": [{
@@ -99,13 +194,161 @@ def get_openai_abbreviation(equipment_name: str, max_length: int = 4) -> Optiona
         if response.status_code == 200:
             abbr = response.json()["choices"][0]["message"]["content"].strip()
             # Ensure it meets our requirements
-            abbr = re.sub(r'[^A-Z]', '', abbr.upper())
+            abbr = _ABBR_STRIP.sub('', abbr.upper())
             return abbr[:max_length] if abbr else None
             
     except Exception as e:
         print(f"Error getting AI abbreviation: {str(e)}")
     return None
 
+def get_openai_abbreviations_batch(names: List[str], max_length: int = 4) -> Dict[str, str]:
+    """Get abbreviation suggestions for several equipment names from a single OpenAI request"""
+    try:
+        api_key = get_openai_api_key()
+        if not api_key or not names:
+            return {}
+            
+        prompt = "\n".join([
+            f"Return ONLY a numbered list of {len(names)} {max_length}-letter uppercase abbreviations for:",
+            *[f"{number}. {name}" for number, name in enumerate(names, 1)]
+        ])
+            
+        # Call OpenAI API
+        response = _SESSION.post(
+            "https://api.openai.com/v1/chat/completions",
+            headers={
+                "Authorization": f"Bearer {api_key}"
+            },
+            timeout=REQUEST_TIMEOUT,
+            json={
+                "model": "gpt-3.5-turbo",
+                "messages": [{
+                    "role": "system",
+                    "content": f"Create a meaningful {max_length}-letter abbreviation for each equipment name. "
+                              "The abbreviations should be intuitive and follow industry standards when possible. "
+                              "Respond with ONLY the numbered list of abbreviations in uppercase, in the same order."
+                }, {
+                    "role": "user",
+                    "content": prompt
+                }],
+                "max_tokens": 10 * len(names) + 10,
+                "temperature": 0.3
+            }
+        )
+        
+        if response.status_code == 200:
+            content = response.json()["choices"][0]["message"]["content"]
+            abbreviations = {}
+            for number, abbr in _NUMBERED_LINE_RE.findall(content):
+                index = int(number) - 1
+                # Ensure it meets our requirements
+                abbr = _ABBR_STRIP.sub('', abbr.upper())
+                if 0 <= index < len(names) and abbr:
+                    abbreviations[names[index]] = abbr[:max_length]
+            return abbreviations
+            
+    except Exception as e:
+        print(f"Error getting AI abbreviations: {str(e)}")
+    return {}
+
+def get_openai_abbreviations_parallel(names: List[str], max_length: int = 4,
+                                      max_workers: int = MAX_CONCURRENT_REQUESTS,
+                                      requests_per_minute: int = REQUESTS_PER_MINUTE) -> Dict[str, str]:
+    """
+    Get abbreviations for equipment names with concurrent, rate-limited OpenAI requests
+    Returns:
+    - dict of {name: abbreviation}, using the offline fallback for names the API couldn't abbreviate
+    """
+    if not names or not get_openai_api_key():
+        return {name: _fallback_abbreviation(name, max_length) for name in names}
+    
+    limiter = _RateLimiter(requests_per_minute, max_workers)
+    
+    def fetch(name):
+        limiter.acquire()
+        return get_openai_abbreviation(name, max_length)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(fetch, names))
+    
+    learned = {name: abbr for name, abbr in zip(names, results) if abbr}
+    if learned:
+        # Cache the results for future use
+        _save_to_cache(learned)
+    
+    return {name: learned.get(name) or _fallback_abbreviation(name, max_length) for name in names}
+
+def prewarm_abbreviations(names, max_length: int = 4) -> None:
+    """Fetch abbreviations for all unknown equipment names in a Series up front, in batched requests"""
+    names = names.dropna()
+    unknown = names[map_known(names).isna()]
+    clean_names = {str(name).lower().strip() for name in unknown.unique()} - {''}
+    
+    # Names containing or resembling a known name are abbreviated locally and don't need OpenAI
+    local = {}
+    pending = []
+    for name in sorted(clean_names):
+        abbr = _match_known_phrase(name) or _match_similar_name(name)
+        if abbr:
+            local[name] = abbr
+        else:
+            pending.append(name)
+    with _cache_lock:
+        EQUIPMENT_ABBR.update(local)
+    
+    learned = {}
+    for start in range(0, len(pending), BATCH_SIZE):
+        learned.update(get_openai_abbreviations_batch(pending[start:start + BATCH_SIZE], max_length))
+    
+    if learned:
+        # Cache the results for future use
+        _save_to_cache(learned)
+    
+    # Names the batches couldn't resolve are requested individually, in parallel
+    missing = [name for name in pending if name not in learned]
+    if missing and get_openai_api_key():
+        get_openai_abbreviations_parallel(missing, max_length)
+
+def _fallback_abbreviation(clean_name: str, max_length: int = 4) -> str:
+    """Build an abbreviation offline from the words of a cleaned equipment name"""
+    # Take first letter of each word
+    words = clean_name.split()
+    if len(words) > 1:
+        abbr = ''.join(word[0] for word in words if word)
+        return abbr[:max_length].upper() if abbr else 'EQP'
+    
+    # Single word: take first max_length characters
+    return clean_name[:max_length].upper() if clean_name else 'EQP'
+
+def fallback_abbr_series(names, max_length: int = 4):
+    """
+    Vectorized version of the offline fallback for a whole Series of equipment names.
+    The per-name get_equipment_abbreviation is meant for isolated lookups; pipelines that
+    abbreviate whole columns should prewarm and then use map_known with this as the fallback.
+    """
+    # Object dtype keeps the regex steps on Python's re, whose \s also matches Unicode
+    # whitespace such as non-breaking spaces, like str.split in _fallback_abbreviation
+    clean = names.where(names.notna(), '').astype(str).astype(object).str.lower().str.strip()
+    # Take first letter of each word for multi-word names, the leading characters otherwise
+    initials = clean.str.replace(_WORD_INITIAL_RE, r'\1', regex=True)
+    abbr = initials.where(clean.str.contains(r'\s', regex=True), clean)
+    abbr = abbr.str.slice(0, max_length).str.upper()
+    return abbr.where(abbr.ne(''), 'EQP').astype(object)
+
+def _match_known_phrase(clean_name: str) -> Optional[str]:
+    """Get the abbreviation of the longest predefined equipment phrase contained in a name"""
+    matches = _KNOWN_PHRASE_RE.findall(clean_name)
+    return EQUIPMENT_ABBR[max(matches, key=len)] if matches else None
+
+def _match_similar_name(clean_name: str) -> Optional[str]:
+    """Get the abbreviation of a predefined equipment name that is a near miss of this one, such as a typo"""
+    matches = difflib.get_close_matches(clean_name, _ABBR_KEYS, n=1, cutoff=FUZZY_MATCH_CUTOFF)
+    return EQUIPMENT_ABBR[matches[0]] if matches else None
+
+def map_known(names):
+    """Look up a whole Series of equipment names in EQUIPMENT_ABBR, with NaN where a name is unknown"""
+    return names.astype('string').str.lower().str.strip().map(EQUIPMENT_ABBR)
+
 def get_equipment_abbreviation(equipment_name: str, max_length: int = 4) -> str:
     """Get or generate an abbreviation for equipment name"""
     if not equipment_name or equipment_name.lower() == 'none':
@@ -117,19 +360,24 @@ def get_equipment_abbreviation(equipment_name: str, max_length: int = 4) -> str:
     # Check predefined mappings
     if clean_name in EQUIPMENT_ABBR:
         return EQUIPMENT_ABBR[clean_name]
+    
+    # Check for a predefined phrase inside the name, e.g. "exhaust fan #3 roof"
+    phrase_abbr = _match_known_phrase(clean_name)
+    if phrase_abbr:
+        return phrase_abbr
+    
+    # Check for a near miss of a predefined name, e.g. "cooling-tower"
+    similar_abbr = _match_similar_name(clean_name)
+    if similar_abbr:
+        EQUIPMENT_ABBR[clean_name] = similar_abbr
+        return similar_abbr
         
     # Try AI-generated abbreviation
     ai_abbr = get_openai_abbreviation(clean_name, max_length)
     if ai_abbr:
         # Cache the result for future use
-        EQUIPMENT_ABBR[clean_name] = ai_abbr
+        _save_to_cache({clean_name: ai_abbr})
         return ai_abbr
         
-    # Fallback: take first letter of each word
-    words = clean_name.split()
-    if len(words) > 1:
-        abbr = ''.join(word[0] for word in words if word)
-        return abbr[:max_length].upper() if abbr else 'EQP'
-    
-    # Single word: take first max_length characters
-    return clean_name[:max_length].upper() if clean_name else 'EQP'
+    # Fallback: build it from the words of the name
+    return _fallback_abbreviation(clean_name, max_length)
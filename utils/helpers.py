@@ -1,4 +1,11 @@
+import os
 import pandas as pd
+from functools import lru_cache
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
 
 def get_short_form(text):
     """Get short form of text for asset ID generation"""
@@ -14,3 +21,25 @@ def clean_and_truncate_facility_name(name, substrings_to_ignore):
             name = name.replace(substring, "")
         return name.split(",")[0].strip()
     return name
+
+@lru_cache(maxsize=1)
+def get_openai_api_key():
+    """Get the OpenAI API key from the environment or the Streamlit secrets file, resolved once"""
+    api_key = os.getenv('OPENAI_API_KEY')
+    if api_key:
+        return api_key
+    
+    secrets_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.streamlit', 'secrets.toml')
+    if not os.path.exists(secrets_path):
+        return None
+    try:
+        if tomllib:
+            with open(secrets_path, 'rb') as f:
+                return tomllib.load(f).get('openai_api_key')
+        with open(secrets_path, 'r') as f:
+            for line in f:
+                if line.startswith('openai_api_key'):
+                    return line.split('=')[1].strip().strip('"\'')
+    except (OSError, ValueError) as e:
+        print(f"Error reading secrets file: {str(e)}")
+    return None